@@ -1,170 +1,309 @@
-import heapq
 import argparse
-from collections import defaultdict
+import os
+from array import array
+from collections import Counter, deque
+from functools import lru_cache
+from operator import itemgetter
 import struct
 
+MAX_CODE_LENGTH = 11  # Предельная длина кода; таблица декодирования содержит 2**MAX_CODE_LENGTH записей
+
 class Node:
+    __slots__ = ('freq', 'char', 'left', 'right')
+
     def __init__(self, freq, char=None, left=None, right=None):
         self.freq = freq  # Частота символа
         self.char = char  # Символ (для листьев)
         self.left = left  # Левый потомок
         self.right = right  # Правый потомок
 
-    def __lt__(self, other):
-        return self.freq < other.freq
-
-def build_frequency_table(text):
-    frequency = defaultdict(int)
-    for char in text:
-        frequency[char] += 1
+def build_frequency_table(data):
+    """Строит гистограмму байтов: список из 256 частот, индексируемый значением байта."""
+    frequency = [0] * 256
+    for symbol, count in Counter(data).items():
+        frequency[symbol] = count
     return frequency
 
 def build_huffman_tree(frequency):
-    heap = []
-    for char, freq in frequency.items():
-        heapq.heappush(heap, Node(freq, char))
-    if len(heap) == 0:
+    """Строит дерево Хаффмана в виде параллельных массивов (symbols, left, right).
+
+    Узел задаётся индексом. Листья занимают первые индексы, symbols[i] — их символ;
+    у внутренних узлов left[i] и right[i] — индексы потомков, у листьев там -1.
+    Потомки всегда создаются раньше родителя, корень — последний узел.
+    """
+    leaves = sorted((freq, symbol) for symbol, freq in enumerate(frequency) if freq)
+    if not leaves:
         return None
-    while len(heap) > 1:
-        node1 = heapq.heappop(heap)
-        node2 = heapq.heappop(heap)
-        merged = Node(node1.freq + node2.freq, None, node1, node2)
-        heapq.heappush(heap, merged)
-    return heap[0]
-
-def build_codes_iterative(root):
-    """Итеративное построение кодов Хаффмана."""
-    codebook = {}
-    if root is None:
-        return codebook
-    stack = [(root, "")]
-    while stack:
-        node, prefix = stack.pop()
-        if node.char is not None:
-            codebook[node.char] = prefix or "0"  # Обработка случая одного символа
+    size = 2 * len(leaves) - 1
+    symbols = array('i', [symbol for _, symbol in leaves]) + array('i', [-1]) * (len(leaves) - 1)
+    left = array('i', [-1]) * size
+    right = array('i', [-1]) * size
+    # Две очереди (частота, индекс узла), обе упорядочены по возрастанию:
+    # листья отсортированы заранее, а объединённые узлы появляются в порядке роста весов.
+    # Поэтому два наименьших элемента всегда находятся в головах очередей.
+    leaf_queue = deque((freq, node_id) for node_id, (freq, _) in enumerate(leaves))
+    merged_queue = deque()
+
+    def pop_smallest():
+        if merged_queue and (not leaf_queue or merged_queue[0][0] < leaf_queue[0][0]):
+            return merged_queue.popleft()
+        return leaf_queue.popleft()
+
+    for node_id in range(len(leaves), size):
+        freq1, left[node_id] = pop_smallest()
+        freq2, right[node_id] = pop_smallest()
+        merged_queue.append((freq1 + freq2, node_id))
+    return symbols, left, right
+
+def build_code_lengths(tree):
+    """Вычисляет длины кодов по глубине листьев: массив из 256 длин (0 — символа нет)."""
+    lengths = array('I', [0]) * 256
+    if tree is None:
+        return lengths
+    symbols, left, right = tree
+    # Родитель всегда правее потомков, поэтому глубины находятся одним проходом от корня
+    depth = array('I', [0]) * len(symbols)
+    for node_id in range(len(symbols) - 1, -1, -1):
+        if left[node_id] < 0:
+            lengths[symbols[node_id]] = depth[node_id] or 1  # Обработка случая одного символа
         else:
-            if node.right:
-                stack.append((node.right, prefix + "1"))
-            if node.left:
-                stack.append((node.left, prefix + "0"))
-    return codebook
+            depth[left[node_id]] = depth[right[node_id]] = depth[node_id] + 1
+    return lengths
 
-def encode(text, codebook):
-    return ''.join(codebook[char] for char in text)
+def limit_code_lengths(frequency, max_length):
+    """Вычисляет оптимальные длины кодов не длиннее max_length алгоритмом Package-Merge."""
+    leaves = sorted((freq, (symbol,)) for symbol, freq in enumerate(frequency) if freq)
+    lengths = array('I', [0]) * 256
+    if len(leaves) == 1:
+        lengths[leaves[0][1][0]] = 1
+        return lengths
+    # Элемент списка — (вес, символы, вошедшие в пакет); на каждом уровне
+    # соседние пары упаковываются и сливаются с исходными листьями.
+    items = leaves
+    for _ in range(max_length - 1):
+        packages = [(items[i][0] + items[i + 1][0], items[i][1] + items[i + 1][1])
+                    for i in range(0, len(items) - 1, 2)]
+        items = sorted(leaves + packages, key=itemgetter(0))
+    # Длина кода символа — число вхождений в 2n-2 самых лёгких элементов
+    for _, symbols in items[:2 * len(leaves) - 2]:
+        for symbol in symbols:
+            lengths[symbol] += 1
+    return lengths
 
-def decode(encoded_bits, root):
-    decoded = []
-    node = root
-    for bit in encoded_bits:
-        node = node.left if bit == '0' else node.right
-        if node.char is not None:
-            decoded.append(node.char)
-            node = root
-    return ''.join(decoded)
-
-def serialize_tree_iterative(root):
-    """Итеративная сериализация дерева в префиксном порядке."""
-    bits = []
-    stack = [root]
-    while stack:
-        node = stack.pop()
-        if node.char is not None:
-            bits.append('1')
-            char_bits = format(ord(node.char), '08b')
-            bits.extend(char_bits)
+def build_canonical_codes(lengths):
+    """Назначает канонические коды: по возрастанию длины, при равной длине — по значению символа.
+
+    Коды хранятся в массиве, параллельном массиву длин: codes[symbol], lengths[symbol].
+    """
+    codes = array('I', [0]) * 256
+    code = 0
+    prev_length = 0
+    for length, symbol in sorted((length, symbol) for symbol, length in enumerate(lengths) if length):
+        code <<= length - prev_length
+        codes[symbol] = code
+        code += 1
+        prev_length = length
+    return codes
+
+def build_tree_from_codes(codes, lengths):
+    """Восстанавливает дерево по кодам (нужно только для вывода на экран)."""
+    root = Node(0)
+    for symbol, length in enumerate(lengths):
+        if not length:
+            continue
+        code = codes[symbol]
+        node = root
+        for shift in range(length - 1, -1, -1):
+            if (code >> shift) & 1:
+                node.right = node.right or Node(0)
+                node = node.right
+            else:
+                node.left = node.left or Node(0)
+                node = node.left
+        node.char = symbol
+    return root
+
+def build_decode_table(codes, lengths):
+    """Строит таблицу декодирования: по MAX_CODE_LENGTH старшим битам потока — пара (символ, длина кода)."""
+    decode_table = [None] * (1 << MAX_CODE_LENGTH)
+    for symbol, length in enumerate(lengths):
+        if not length:
+            continue
+        # Все записи, чьи старшие length битов совпадают с кодом, указывают на символ
+        shift = MAX_CODE_LENGTH - length
+        start = codes[symbol] << shift
+        decode_table[start:start + (1 << shift)] = [(symbol, length)] * (1 << shift)
+    return decode_table
+
+def build_pair_table(decode_table):
+    """Строит таблицу, которая по тем же битам выдаёт сразу два символа, если оба кода умещаются.
+
+    Запись — (байты декодированных символов, суммарная длина кодов).
+    """
+    mask = (1 << MAX_CODE_LENGTH) - 1
+    pair_table = []
+    for index, entry in enumerate(decode_table):
+        if entry is None:
+            pair_table.append(None)
+            continue
+        symbol, length = entry
+        second = decode_table[(index << length) & mask]
+        if second is not None and length + second[1] <= MAX_CODE_LENGTH:
+            pair_table.append((bytes((symbol, second[0])), length + second[1]))
         else:
-            bits.append('0')
-            # Push right first so that left is processed first
-            if node.right:
-                stack.append(node.right)
-            if node.left:
-                stack.append(node.left)
-    bit_string = ''.join(bits)
-    return bit_string_to_bytes(bit_string)
-
-def deserialize_tree_iterative(bit_bytes):
-    """Итеративная десериализация дерева из байтовой строки."""
-    bit_string = bytes_to_bit_string(bit_bytes)
-    it = iter(bit_string)
-    stack = []
-    root = None
+            pair_table.append((bytes((symbol,)), length))
+    return pair_table
+
+@lru_cache(maxsize=64)
+def build_decode_lookup(lengths):
+    """Строит таблицы декодирования (одиночную и парную) по кортежу длин кодов.
+
+    Результат кэшируется: файлы с одинаковым заголовком декодируются
+    по уже построенным таблицам.
+    """
+    decode_table = build_decode_table(build_canonical_codes(lengths), lengths)
+    return decode_table, build_pair_table(decode_table)
+
+def decode(encoded_bits, decode_table, pair_table, sym_count):
+    """Декодирует sym_count символов из упакованного потока, разрешая один-два символа за обращение.
+
+    Результат — bytearray: он сразу пишется в файл без лишней копии.
+    """
+    width = MAX_CODE_LENGTH  # Столько битов достаточно, чтобы прочитать любой код
+    mask = (1 << width) - 1
+    decoded = bytearray()
+    bitbuf = 0
+    bitcnt = 0
+    payload = memoryview(encoded_bits)
+    # Основную часть потока разбираем на 32-битные слова через struct, не копируя их в память
+    whole = len(payload) >> 2
     try:
-        while True:
-            bit = next(it)
-            if bit == '1':
-                char_bits = ''.join(next(it) for _ in range(8))
-                leaf = Node(0, chr(int(char_bits, 2)))
-                if not stack:
-                    root = leaf
-                else:
-                    parent = stack[-1]
-                    if parent.left is None:
-                        parent.left = leaf
-                    elif parent.right is None:
-                        parent.right = leaf
-                        stack.pop()  # Node now has both children
-            else:  # bit == '0'
-                internal = Node(0, None)
-                if not stack:
-                    root = internal
-                else:
-                    parent = stack[-1]
-                    if parent.left is None:
-                        parent.left = internal
-                    elif parent.right is None:
-                        parent.right = internal
-                        stack.pop()
-                stack.append(internal)
-    except StopIteration:
-        pass
-    return root
+        for (word,) in struct.iter_unpack('>I', payload[:whole << 2]):
+            bitbuf = ((bitbuf & ((1 << bitcnt) - 1)) << 32) | word
+            bitcnt += 32
+            while bitcnt >= width:
+                symbols, length = pair_table[(bitbuf >> (bitcnt - width)) & mask]
+                decoded += symbols
+                bitcnt -= length
+    except TypeError:
+        # Пустая запись таблицы: такие биты не начинают ни один код
+        # (у единственного символа с кодом «0» свободна вся половина с «1»)
+        raise ValueError("Файл поврежден или некорректен.") from None
+    # Хвост потока: оставшиеся байты и нули, чтобы последний код можно было прочитать целиком.
+    # Здесь символы читаются по одному, и каждый код обязан закончиться в настоящих битах
+    # файла, а не в дописанных нулях: иначе поток обрезан.
+    rest = payload[whole << 2:]
+    bitbuf = (((bitbuf & ((1 << bitcnt) - 1)) << (len(rest) << 3)) | int.from_bytes(rest, 'big')) << width
+    bitcnt += (len(rest) << 3) + width
+    while len(decoded) < sym_count:
+        entry = decode_table[(bitbuf >> (bitcnt - width)) & mask]
+        if entry is None or bitcnt - entry[1] < width:
+            raise ValueError("Файл поврежден или некорректен.")
+        decoded.append(entry[0])
+        bitcnt -= entry[1]
+    # Символы, прочитанные из битов дополнения в конце последнего байта, отбрасываем
+    del decoded[sym_count:]
+    return decoded
 
-def bit_string_to_bytes(s):
-    """Преобразует строку битов в байты."""
-    padding = (8 - len(s) % 8) % 8
-    s += '0' * padding
-    byte_array = bytearray()
-    for i in range(0, len(s), 8):
-        byte = s[i:i+8]
-        byte_array.append(int(byte, 2))
-    return bytes([padding]) + bytes(byte_array)  # Первый байт хранит количество добавленных нулей
-
-def bytes_to_bit_string(b):
-    """Преобразует байты в строку битов, учитывая количество заполненных битов."""
-    padding = b[0]
-    bit_string = ''.join(f'{byte:08b}' for byte in b[1:])
-    if padding > 0:
-        bit_string = bit_string[:-padding]
-    return bit_string
-
-def save_encoded_file(encoded_bits, tree_bits, output_file):
-    """Сохраняет закодированные данные вместе с сериализованным деревом в бинарном формате."""
-    with open(output_file, 'wb') as f:
-        # Сначала записываем длину дерева в байтах
-        tree_length = len(tree_bits)
-        f.write(struct.pack('>I', tree_length))  # 4 байта для длины
-        # Записываем сериализованное дерево
-        f.write(tree_bits)
-        # Записываем закодированные данные
-        f.write(encoded_bits)
+def serialize_code_lengths(lengths):
+    """Упаковывает 256 длин кодов по 4 бита: 128 байт."""
+    return bytes((lengths[i] << 4) | lengths[i + 1] for i in range(0, 256, 2))
+
+def deserialize_code_lengths(lengths_bytes):
+    """Распаковывает длины кодов из заголовка файла."""
+    if len(lengths_bytes) != 128:
+        raise ValueError("Файл поврежден или некорректен.")
+    # Старший полубайт — длина кода чётного символа, младший — нечётного
+    lengths = array('I', [0]) * 256
+    lengths[0::2] = array('I', [byte >> 4 for byte in lengths_bytes])
+    lengths[1::2] = array('I', [byte & 0x0F for byte in lengths_bytes])
+    if max(lengths) > MAX_CODE_LENGTH:
+        raise ValueError("Файл поврежден или некорректен.")
+    # Длины должны задавать полный префиксный код (сумма Крафта равна единице);
+    # исключение — единственный символ с кодом длины 1
+    kraft_sum = sum(1 << (MAX_CODE_LENGTH - length) for length in lengths if length)
+    single_symbol = kraft_sum == 1 << (MAX_CODE_LENGTH - 1) and lengths.count(1) == 1
+    if kraft_sum and kraft_sum != 1 << MAX_CODE_LENGTH and not single_symbol:
+        raise ValueError("Файл поврежден или некорректен.")
+    return lengths
+
+class BitWriter:
+    """Побитовая запись в файл: данные кодируются блоками, готовые байты сразу уходят в файл."""
+
+    def __init__(self, fileobj, block_size=1 << 16):
+        self.fileobj = fileobj
+        self.block_size = block_size  # Сколько входных байтов кодируется за один проход
+        self.acc = 0  # Накопитель ещё не записанных битов
+        self.nbits = 0  # Количество битов в накопителе
+
+    def write_codes(self, data, codes, lengths):
+        """Кодирует байты data по параллельным массивам кодов и их длин.
+
+        Цикл по символам выполняют встроенные map, str.join и int(..., 2):
+        блок превращается в строку битов и разом переводится в число.
+        """
+        code_strings = [format(code, f'0{length}b') if length else None
+                        for code, length in zip(codes, lengths)]
+        lookup = code_strings.__getitem__
+        for start in range(0, len(data), self.block_size):
+            bits = ''.join(map(lookup, data[start:start + self.block_size]))
+            acc = (self.acc << len(bits)) | int(bits, 2)
+            nbits = self.nbits + len(bits)
+            # Записываем все целые байты, неполный остаток оставляем в накопителе
+            self.nbits = nbits & 7
+            self.fileobj.write((acc >> self.nbits).to_bytes(nbits >> 3, 'big'))
+            self.acc = acc & ((1 << self.nbits) - 1)
+
+    def flush(self):
+        """Дописывает остаток накопителя, дополнив его нулями до целого байта."""
+        padding = (8 - self.nbits) % 8
+        self.fileobj.write((self.acc << padding).to_bytes((self.nbits + padding) // 8, 'big'))
+        self.acc = 0
+        self.nbits = 0
+
+def save_encoded_file(data, codes, lengths, output_file):
+    """Записывает длины кодов и потоково кодирует данные в бинарный файл."""
+    lengths_bytes = serialize_code_lengths(lengths)
+    tree_length = len(lengths_bytes)
+    with open(output_file, 'wb', buffering=1 << 20) as f:
+        # Заголовок одним вызовом: размер таблицы длин и число символов (по 4 байта)
+        # и сами длины. Зная число символов, декодер не нуждается в счётчике дополнения.
+        f.write(struct.pack('>II', tree_length, len(data)) + lengths_bytes)
+        # Кодируем данные, не собирая весь поток в памяти
+        writer = BitWriter(f)
+        writer.write_codes(data, codes, lengths)
+        writer.flush()
 
 def load_encoded_file(input_file):
-    """Загружает закодированные данные и сериализованное дерево из бинарного файла."""
-    with open(input_file, 'rb') as f:
-        # Считываем первые 4 байта для длины дерева
-        tree_length_bytes = f.read(4)
-        if len(tree_length_bytes) < 4:
-            raise ValueError("Файл поврежден или некорректен.")
-        tree_length = struct.unpack('>I', tree_length_bytes)[0]
-        # Считываем сериализованное дерево
-        tree_bits = f.read(tree_length)
-        # Считываем закодированные данные
-        encoded_bits = f.read()
-    return tree_bits, encoded_bits
-
-def display_codes(codebook):
+    """Загружает закодированные данные и длины кодов из бинарного файла одним чтением."""
+    fd = os.open(input_file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        content = os.read(fd, size)
+        while len(content) < size:  # os.read может вернуть меньше запрошенного
+            chunk = os.read(fd, size - len(content))
+            if not chunk:
+                break
+            content += chunk
+    finally:
+        os.close(fd)
+    # Первые 8 байтов — размер таблицы длин и число закодированных символов
+    if len(content) < 8:
+        raise ValueError("Файл поврежден или некорректен.")
+    tree_length, sym_count = struct.unpack_from('>II', content)
+    # Длины кодов и закодированные данные берём срезами без копирования
+    view = memoryview(content)
+    lengths_bytes = view[8:8 + tree_length]
+    encoded_bits = view[8 + tree_length:]
+    return lengths_bytes, sym_count, encoded_bits
+
+def display_codes(codes, lengths):
     print("Коды Хаффмана:")
-    for char, code in sorted(codebook.items()):
+    for symbol, length in enumerate(lengths):
+        if not length:
+            continue
+        code = format(codes[symbol], f'0{length}b')
+        char = chr(symbol)
         if char == ' ':
             display_char = "' ' (пробел)"
         elif char == '\n':
@@ -179,7 +318,7 @@ def display_tree_iterative(root):
     while stack:
         node, prefix = stack.pop()
         if node.char is not None:
-            print(f"{prefix}Leaf: {repr(node.char)}")
+            print(f"{prefix}Leaf: {repr(chr(node.char))}")
         else:
             print(f"{prefix}Node:")
             # Push right first so that left is processed first
@@ -189,40 +328,40 @@ def display_tree_iterative(root):
                 stack.append((node.left, prefix + " 0-"))
 
 def encode_file(input_file, output_file, display=False, display_tree_flag=False):
-    with open(input_file, 'r', encoding='ascii') as f:
-        text = f.read()
-    frequency = build_frequency_table(text)
+    with open(input_file, 'rb') as f:
+        data = f.read()
+    frequency = build_frequency_table(data)
     tree = build_huffman_tree(frequency)
     if tree is None:
         print("Входной файл пуст.")
         return
-    codebook = build_codes_iterative(tree)
-    encoded_bit_string = encode(text, codebook)
-    encoded_bits = bit_string_to_bytes(encoded_bit_string)
-    tree_bits = serialize_tree_iterative(tree)
-    save_encoded_file(encoded_bits, tree_bits, output_file)
+    lengths = build_code_lengths(tree)
+    if max(lengths) > MAX_CODE_LENGTH:
+        lengths = limit_code_lengths(frequency, MAX_CODE_LENGTH)
+    codes = build_canonical_codes(lengths)
+    save_encoded_file(data, codes, lengths, output_file)
     if display:
-        display_codes(codebook)
+        display_codes(codes, lengths)
     if display_tree_flag:
         print("Дерево Хаффмана:")
-        display_tree_iterative(tree)
+        display_tree_iterative(build_tree_from_codes(codes, lengths))
 
 def decode_file(input_file, output_file, display=False, display_tree_flag=False):
-    tree_bits, encoded_bits = load_encoded_file(input_file)
-    tree = deserialize_tree_iterative(tree_bits)
-    if tree is None:
+    lengths_bytes, sym_count, encoded_bits = load_encoded_file(input_file)
+    lengths = deserialize_code_lengths(lengths_bytes)
+    if not any(lengths):
         print("Входной файл не содержит данных для декодирования.")
         return
     if display_tree_flag:
         print("Дерево Хаффмана:")
-        display_tree_iterative(tree)
-    encoded_bit_string = bytes_to_bit_string(encoded_bits)
-    decoded_text = decode(encoded_bit_string, tree)
-    with open(output_file, 'w', encoding='ascii') as f:
-        f.write(decoded_text)
+        display_tree_iterative(build_tree_from_codes(build_canonical_codes(lengths), lengths))
+    decode_table, pair_table = build_decode_lookup(tuple(lengths))
+    decoded = decode(encoded_bits, decode_table, pair_table, sym_count)
+    with open(output_file, 'wb') as f:
+        f.write(decoded)
     if display:
         print("Декодированный текст:")
-        print(decoded_text)
+        print(decoded.decode('ascii', errors='replace'))
 
 def main():
     parser = argparse.ArgumentParser(description="Система кодирования и декодирования с использованием алгоритма Хаффмана.")
@@ -230,7 +369,7 @@ def main():
 
     # Подкоманда encode
     encode_parser = subparsers.add_parser('encode', help='Кодирование файла')
-    encode_parser.add_argument('input', help='Входной текстовый файл для кодирования')
+    encode_parser.add_argument('input', help='Входной файл для кодирования (любые байты)')
     encode_parser.add_argument('output', help='Выходной файл с закодированными данными')
     encode_parser.add_argument('-c', '--codes', action='store_true', help='Отобразить коды Хаффмана')
     encode_parser.add_argument('-t', '--tree', action='store_true', help='Отобразить дерево Хаффмана')
@@ -238,7 +377,7 @@ def main():
     # Подкоманда decode
     decode_parser = subparsers.add_parser('decode', help='Декодирование файла')
     decode_parser.add_argument('input', help='Входной файл с закодированными данными')
-    decode_parser.add_argument('output', help='Выходной текстовый файл с декодированными данными')
+    decode_parser.add_argument('output', help='Выходной файл с декодированными данными')
     decode_parser.add_argument('-c', '--codes', action='store_true', help='Отобразить декодированный текст')
     decode_parser.add_argument('-t', '--tree', action='store_true', help='Отобразить дерево Хаффмана')
 